@@ -1,7 +1,11 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import copy
+import math
+
 import pytest
+import torch
 
 from utils_nlp.models.bert.common import create_data_loader
 
@@ -16,6 +20,59 @@ def test_tokenize(bert_english_tokenizer):
     assert tokens[2][1].startswith("##")
 
 
+def test_preprocess_classification_tokens(bert_english_tokenizer):
+    max_len = 12
+    tokenizer = bert_english_tokenizer
+    convert_tokens_to_ids = tokenizer.tokenizer.convert_tokens_to_ids
+
+    # single sequences: [CLS] a [SEP]
+    tokens = tokenizer.tokenize(["Hello World.", "How you doing?"])
+    input_ids, input_mask, token_type_ids = tokenizer.preprocess_classification_tokens(
+        tokens, max_len=max_len
+    )
+    assert input_ids.shape == (2, max_len)
+    assert input_mask.shape == (2, max_len)
+    assert token_type_ids is None
+    expected_ids = convert_tokens_to_ids(["[CLS]"] + tokens[0] + ["[SEP]"])
+    num_padding = max_len - len(expected_ids)
+    assert input_ids[0].tolist() == expected_ids + [0] * num_padding
+    assert input_mask[0].tolist() == [1] * len(expected_ids) + [0] * num_padding
+
+    # sequence pairs: [CLS] a [SEP] b [SEP]
+    text = [
+        ("Hello World.", "How you doing?"),
+        ("greatttt", "This is a much longer second sentence that gets truncated."),
+    ]
+    tokens = tokenizer.tokenize(text)
+    tokens_copy = copy.deepcopy(tokens)
+    input_ids, input_mask, token_type_ids = tokenizer.preprocess_classification_tokens(
+        tokens, max_len=max_len
+    )
+    # the input tokens are not modified
+    assert tokens == tokens_copy
+    assert input_ids.shape == (2, max_len)
+    assert token_type_ids.shape == (2, max_len)
+
+    # the first pair fits and is padded
+    a, b = tokens[0]
+    expected_ids = convert_tokens_to_ids(["[CLS]"] + a + ["[SEP]"] + b + ["[SEP]"])
+    num_padding = max_len - len(expected_ids)
+    assert input_ids[0].tolist() == expected_ids + [0] * num_padding
+    assert input_mask[0].tolist() == [1] * len(expected_ids) + [0] * num_padding
+    assert token_type_ids[0].tolist() == (
+        [0] * (len(a) + 2) + [1] * (len(b) + 1) + [0] * num_padding
+    )
+
+    # the longer sequence of the second pair is truncated
+    a, b = tokens[1]
+    assert len(a) + len(b) > max_len - 3
+    b = b[: max_len - 3 - len(a)]
+    expected_ids = convert_tokens_to_ids(["[CLS]"] + a + ["[SEP]"] + b + ["[SEP]"])
+    assert input_ids[1].tolist() == expected_ids
+    assert input_mask[1].tolist() == [1] * max_len
+    assert token_type_ids[1].tolist() == [0] * (len(a) + 2) + [1] * (len(b) + 1)
+
+
 def test_tokenize_ner(ner_test_data, bert_english_tokenizer):
     seq_length = 20
 
@@ -30,9 +87,9 @@ def test_tokenize_ner(ner_test_data, bert_english_tokenizer):
     assert len(preprocessed_tokens[0][0]) == seq_length
     assert len(preprocessed_tokens[1][0]) == seq_length
     assert (
-        preprocessed_tokens[2] == ner_test_data["EXPECTED_TRAILING_TOKEN_MASK"]
+        preprocessed_tokens[2].tolist() == ner_test_data["EXPECTED_TRAILING_TOKEN_MASK"]
     )
-    assert preprocessed_tokens[3] == ner_test_data["EXPECTED_LABEL_IDS"]
+    assert preprocessed_tokens[3].tolist() == ner_test_data["EXPECTED_LABEL_IDS"]
 
     # test when input is a single list
     preprocessed_tokens = bert_english_tokenizer.tokenize_ner(
@@ -45,9 +102,9 @@ def test_tokenize_ner(ner_test_data, bert_english_tokenizer):
     assert len(preprocessed_tokens[0][0]) == seq_length
     assert len(preprocessed_tokens[1][0]) == seq_length
     assert (
-        preprocessed_tokens[2] == ner_test_data["EXPECTED_TRAILING_TOKEN_MASK"]
+        preprocessed_tokens[2].tolist() == ner_test_data["EXPECTED_TRAILING_TOKEN_MASK"]
     )
-    assert preprocessed_tokens[3] == ner_test_data["EXPECTED_LABEL_IDS"]
+    assert preprocessed_tokens[3].tolist() == ner_test_data["EXPECTED_LABEL_IDS"]
 
     # test not providing labels
     preprocessed_tokens = bert_english_tokenizer.tokenize_ner(
@@ -56,7 +113,7 @@ def test_tokenize_ner(ner_test_data, bert_english_tokenizer):
         max_len=20,
     )
     assert (
-        preprocessed_tokens[2] == ner_test_data["EXPECTED_TRAILING_TOKEN_MASK"]
+        preprocessed_tokens[2].tolist() == ner_test_data["EXPECTED_TRAILING_TOKEN_MASK"]
     )
 
     # text exception when number of words and number of labels are different
@@ -78,16 +135,37 @@ def test_create_data_loader(ner_test_data):
             sample_method="dummy",
         )
 
-    create_data_loader(
-        input_ids=ner_test_data["INPUT_TOKEN_IDS"],
-        input_mask=ner_test_data["INPUT_MASK"],
-        label_ids=ner_test_data["INPUT_LABEL_IDS"],
+    num_samples = 5
+    batch_size = 2
+    dataloader = create_data_loader(
+        input_ids=ner_test_data["INPUT_TOKEN_IDS"] * num_samples,
+        input_mask=ner_test_data["INPUT_MASK"] * num_samples,
+        label_ids=ner_test_data["INPUT_LABEL_IDS"] * num_samples,
         sample_method="sequential",
+        batch_size=batch_size,
+        num_workers=0,
     )
-
-    create_data_loader(
+    assert len(dataloader) == math.ceil(num_samples / batch_size)
+    seq_len = len(ner_test_data["INPUT_TOKEN_IDS"][0])
+    batches = list(dataloader)
+    assert len(batches) == len(dataloader)
+    for i, (b_input_ids, b_input_mask, b_label_ids) in enumerate(batches):
+        expected_shape = (min(batch_size, num_samples - i * batch_size), seq_len)
+        assert b_input_ids.shape == expected_shape
+        assert b_input_mask.shape == expected_shape
+        assert b_label_ids.shape == expected_shape
+        assert b_input_ids.dtype == torch.long
+        assert b_input_mask.dtype == torch.bool
+        assert b_label_ids.dtype == torch.int16
+    assert batches[0][0][0].tolist() == ner_test_data["INPUT_TOKEN_IDS"][0]
+
+    dataloader = create_data_loader(
         input_ids=ner_test_data["INPUT_TOKEN_IDS"],
         input_mask=ner_test_data["INPUT_MASK"],
         label_ids=ner_test_data["INPUT_LABEL_IDS"],
         sample_method="random",
     )
+    input_ids, input_mask, label_ids = dataloader.dataset.tensors
+    assert input_ids.dtype == torch.long
+    assert input_mask.dtype == torch.bool
+    assert label_ids.dtype == torch.int16
@@ -12,6 +12,7 @@ from utils_nlp.common.pytorch_utils import (
     get_device,
     move_model_to_device,
     parallelize_model,
+    wrap_for_amp,
 )
 
 
@@ -48,6 +49,27 @@ def test_get_device_gpu():
     assert gpus == 1
 
 
+@pytest.mark.gpu
+def test_get_device_gpu_ids():
+    num_cuda_devices = torch.cuda.device_count()
+    device, gpus = get_device(gpu_ids=[0])
+    assert device.index == 0
+
+    # invalid gpu ids are ignored
+    device, gpus = get_device(gpu_ids=[num_cuda_devices, num_cuda_devices - 1])
+    assert device.type == "cuda"
+    assert device.index == num_cuda_devices - 1
+
+
+@pytest.mark.gpu
+@pytest.mark.skipif(torch.cuda.device_count() < 2, reason="Requires 2 or more GPUs")
+def test_get_device_gpu_ids_lowest():
+    # the lowest valid gpu id is used, regardless of the order of the list
+    device, gpus = get_device(gpu_ids=[1, 0])
+    assert device.type == "cuda"
+    assert device.index == 0
+
+
 @pytest.mark.gpu
 def test_get_device_all_gpus():
     device, gpus = get_device()
@@ -223,3 +245,21 @@ def test_parallelize_model(model):
         gpu_ids=[x + num_cuda_devices for x in list(range(num_cuda_devices))],
     )
     assert next(model_cuda_cpu.parameters()).is_cuda is False
+
+
+@pytest.mark.skipif(
+    not hasattr(torch, "autocast"), reason="Native AMP requires PyTorch 1.10 or later"
+)
+def test_wrap_for_amp(model):
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    model_amp, optimizer_amp, scaler = wrap_for_amp(model, optimizer)
+    assert model_amp is model
+    assert optimizer_amp is optimizer
+    assert scaler is None
+
+    _, _, scaler = wrap_for_amp(model, optimizer, dtype=torch.float16)
+    grad_scaler = getattr(torch.amp, "GradScaler", None) or torch.cuda.amp.GradScaler
+    assert isinstance(scaler, grad_scaler)
+
+    with pytest.raises(ValueError):
+        wrap_for_amp(model, optimizer, dtype=torch.float32)
@@ -41,7 +41,7 @@ CONDA_BASE = {
     "numpy": "numpy>=1.13.3",
     "pandas": "pandas>=0.24.2",
     "pytest": "pytest>=3.6.4",
-    "pytorch": "pytorch-cpu>=1.0.0",
+    "pytorch": "pytorch>=1.4.0",
     "scipy": "scipy>=1.0.0",
     "h5py": "h5py>=2.8.0",
     "tensorflow": "tensorflow==1.15.0",
@@ -82,6 +82,7 @@ PIP_BASE = {
         "en_core_web_sm-2.1.0/en_core_web_sm-2.1.0.tar.gz"
     ),
     "transformers": "transformers==2.5.0",
+    "tokenizers": "tokenizers==0.5.0",
     "gensim": "gensim>=3.7.0",
     "nltk": "nltk>=3.4",
     "seqeval": "seqeval>=0.0.12",
@@ -119,7 +120,7 @@ CONDA_LINUX = {}
 CONDA_LINUX_GPU = {}
 
 CONDA_WIN32 = {}
-CONDA_WIN32_GPU = {"pytorch": "pytorch==1.0.0", "cudatoolkit": "cuda90"}
+CONDA_WIN32_GPU = {}
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -3,12 +3,33 @@
 
 """Common PyTorch utilities that facilitate building PyTorch models."""
 
+import warnings
+
 import torch
 from torch.utils.data import DataLoader, RandomSampler, SequentialSampler
 from torch.utils.data.distributed import DistributedSampler
 
 
 def get_device(num_gpus=None, gpu_ids=None, local_rank=-1):
+    """Gets the device to use and the number of GPUs available for it.
+
+    Args:
+        num_gpus (int, optional): The number of GPUs to be used.
+            If set to None, all available GPUs will be used.
+            Defaults to None.
+        gpu_ids (list, optional): List of GPU IDs to be used. IDs are
+            ordinals among the devices visible through CUDA_VISIBLE_DEVICES.
+            If not None, overrides num_gpus and the returned device is the
+            lowest valid id in the list, which is where DataParallel gathers
+            outputs since parallelize_model sorts the ids. Defaults to None.
+        local_rank (int, optional): Local GPU ID within a node. Used in
+            distributed environments, where each process uses the GPU of
+            its own rank. If not -1, num_gpus and gpu_ids are ignored.
+            Defaults to -1.
+
+    Returns:
+        tuple: A tuple of the torch.device and the number of GPUs to be used.
+    """
     if gpu_ids is not None:
         num_gpus = len(gpu_ids)
     if local_rank == -1:
@@ -17,9 +38,17 @@ def get_device(num_gpus=None, gpu_ids=None, local_rank=-1):
             if num_gpus is not None
             else torch.cuda.device_count()
         )
-        device = torch.device(
-            "cuda" if torch.cuda.is_available() and num_gpus > 0 else "cpu"
-        )
+        if torch.cuda.is_available() and num_gpus > 0:
+            valid_gpu_ids = [
+                i for i in gpu_ids or [] if 0 <= i < torch.cuda.device_count()
+            ]
+            device = (
+                torch.device("cuda", min(valid_gpu_ids))
+                if valid_gpu_ids
+                else torch.device("cuda")
+            )
+        else:
+            device = torch.device("cpu")
     else:
         torch.cuda.set_device(local_rank)
         device = torch.device("cuda", local_rank)
@@ -44,6 +73,10 @@ def move_model_to_device(model, device):
 def parallelize_model(model, device, num_gpus=None, gpu_ids=None, local_rank=-1):
     """Moves a model to the specified device (cpu or gpu/s)
        and implements data parallelism when multiple gpus are specified.
+
+       DistributedDataParallel is used when local_rank is set, e.g. by
+       torch.distributed.launch, and is the recommended way of using
+       multiple gpus. The DataParallel wrapper used otherwise is deprecated.
     Args:
         model (Module): A PyTorch model.
         device (torch.device): A PyTorch device.
@@ -72,6 +105,9 @@ def parallelize_model(model, device, num_gpus=None, gpu_ids=None, local_rank=-1)
     )  # Take care of distributed/parallel training
 
     if local_rank != -1:
+        if not torch.distributed.is_initialized():
+            torch.distributed.init_process_group(backend="nccl")
+        model_module = model_module.to(torch.device("cuda", local_rank))
         model = torch.nn.parallel.DistributedDataParallel(
             model_module,
             device_ids=[local_rank],
@@ -94,12 +130,64 @@ def parallelize_model(model, device, num_gpus=None, gpu_ids=None, local_rank=-1)
                 )
                 gpu_ids = list(range(num_gpus))
             else:
-                gpu_ids = list(set(list(range(num_cuda_devices))).intersection(gpu_ids))
+                gpu_ids = sorted(set(range(num_cuda_devices)).intersection(gpu_ids))
             if len(gpu_ids) > 0:
+                if len(gpu_ids) > 1:
+                    warnings.warn(
+                        "DataParallel is deprecated for multi-gpu training, "
+                        "set local_rank to use DistributedDataParallel instead.",
+                        FutureWarning,
+                    )
                 model = torch.nn.DataParallel(model_module, device_ids=gpu_ids)
     return model
 
 
+def wrap_for_amp(model, optimizer, dtype=torch.bfloat16):
+    """Prepares a model and its optimizer for native automatic mixed precision
+       training, moving matrix multiplications to half precision tensor cores.
+       The forward pass and loss are run under autocast:
+
+        model, optimizer, scaler = wrap_for_amp(model, optimizer, dtype)
+        with torch.autocast("cuda", dtype=dtype):
+            loss = model(...)
+        if scaler is None:
+            loss.backward()
+            optimizer.step()
+        else:
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
+
+    Args:
+        model (Module): A PyTorch model, e.g. returned by parallelize_model.
+        optimizer (Optimizer): The optimizer of the model.
+        dtype (torch.dtype, optional): The half precision type, torch.bfloat16
+            or torch.float16. bfloat16 needs Ampere or newer gpus but no loss
+            scaling. Defaults to torch.bfloat16. Requires PyTorch 1.10 or
+            later, where torch.autocast was introduced.
+
+    Returns:
+        tuple: The model, the optimizer and a GradScaler scaling float16 losses,
+            or None for bfloat16.
+    """
+    if dtype not in (torch.float16, torch.bfloat16):
+        raise ValueError("dtype must be torch.float16 or torch.bfloat16.")
+    if not hasattr(torch, "autocast"):
+        # torch.autocast and bfloat16 autocasting were added in PyTorch 1.10
+        raise ImportError(
+            "Native mixed precision requires PyTorch 1.10 or later, "
+            "use get_amp for apex mixed precision instead."
+        )
+    scaler = None
+    if dtype == torch.float16:
+        # torch.cuda.amp.GradScaler is deprecated in favor of torch.amp.GradScaler
+        if hasattr(torch.amp, "GradScaler"):
+            scaler = torch.amp.GradScaler("cuda")
+        else:
+            scaler = torch.cuda.amp.GradScaler()
+    return model, optimizer, scaler
+
+
 def dataloader_from_dataset(
     ds, batch_size=32, num_gpus=None, shuffle=False, distributed=False
 ):
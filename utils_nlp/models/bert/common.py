@@ -7,15 +7,21 @@
 # /run_glue.py
 
 import csv
+import functools
 import linecache
+import multiprocessing
 import subprocess
 import warnings
 from collections.abc import Iterable
 from enum import Enum
 
+import numpy as np
 import torch
-from pytorch_pretrained_bert.tokenization import BertTokenizer
+from pytorch_pretrained_bert.file_utils import cached_path
+from pytorch_pretrained_bert.tokenization import PRETRAINED_VOCAB_ARCHIVE_MAP, BertTokenizer
+from tokenizers import BertWordPieceTokenizer
 from torch.utils.data import (
+    BatchSampler,
     DataLoader,
     Dataset,
     RandomSampler,
@@ -23,7 +29,7 @@ from torch.utils.data import (
     TensorDataset,
     ConcatDataset,
 )
-from tqdm import tqdm
+from torch.utils.data.distributed import DistributedSampler
 
 # Max supported sequence length
 BERT_MAX_LEN = 512
@@ -42,20 +48,43 @@ class Language(str, Enum):
     MULTILINGUAL: str = "bert-base-multilingual-cased"
 
 
+@functools.lru_cache(maxsize=8)
+def _load_tokenizers(language, to_lower, cache_dir):
+    """Loads the vocabulary of a pretrained model once and builds the BertTokenizer and
+    the fast BertWordPieceTokenizer sharing it. Tokenizers are reused by Tokenizer
+    instances created with the same arguments."""
+    vocab_file = cached_path(PRETRAINED_VOCAB_ARCHIVE_MAP[language], cache_dir=cache_dir)
+    tokenizer = BertTokenizer(vocab_file, do_lower_case=to_lower, max_len=BERT_MAX_LEN)
+    # lower casing and accent stripping are done by the normalizer of the
+    # fast tokenizer; like BERT's BasicTokenizer, accents are only
+    # stripped when lower casing, which keeps cased models' input intact
+    fast_tokenizer = BertWordPieceTokenizer(
+        vocab_file, add_special_tokens=False, strip_accents=to_lower, lowercase=to_lower
+    )
+    return tokenizer, fast_tokenizer
+
+
 class Tokenizer:
     def __init__(self, language=Language.ENGLISH, to_lower=False, cache_dir="."):
         """Initializes the underlying pretrained BERT tokenizer.
 
+        WordPiece tokenization is done by the Rust-backed BertWordPieceTokenizer
+        of the `tokenizers` package, which shares the vocabulary file.
+
         Args:
             language (Language, optional): The pretrained model's language.
                                            Defaults to Language.ENGLISH.
+            to_lower (bool, optional): Lower case text input.
+                Defaults to False.
             cache_dir (str, optional): Location of BERT's cache directory.
                 Defaults to ".".
         """
-        self.tokenizer = BertTokenizer.from_pretrained(
-            language, do_lower_case=to_lower, cache_dir=cache_dir
-        )
+        self.tokenizer, self.fast_tokenizer = _load_tokenizers(language, to_lower, cache_dir)
         self.language = language
+        self.to_lower = to_lower
+        self._cls_id, self._sep_id, self._pad_id = self.tokenizer.convert_tokens_to_ids(
+            ["[CLS]", "[SEP]", "[PAD]"]
+        )
 
     def tokenize(self, text):
         """Tokenizes a list of documents using a BERT tokenizer
@@ -69,9 +98,14 @@ class Tokenizer:
                 of the input sequence(s).
         """
         if isinstance(text[0], str):
-            return [self.tokenizer.tokenize(x) for x in tqdm(text)]
+            return [x.tokens for x in self.fast_tokenizer.encode_batch(list(text))]
         else:
-            return [[self.tokenizer.tokenize(x) for x in sentences] for sentences in tqdm(text)]
+            # tokenize all sequences in a single batch, which is split across
+            # CPU cores by the Rust tokenizer, and regroup them afterwards
+            encodings = iter(
+                self.fast_tokenizer.encode_batch([x for sentences in text for x in sentences])
+            )
+            return [[next(encodings).tokens for _ in sentences] for sentences in text]
 
     def _truncate_seq_pair(self, tokens_a, tokens_b, max_length):
         """Truncates a sequence pair in place to the maximum length."""
@@ -100,6 +134,21 @@ class Tokenizer:
 
         return [tokens_a, tokens_b]
 
+    @staticmethod
+    def _truncate_seq_pair_lengths(len_a, len_b, max_length):
+        """Computes the lengths of a sequence pair truncated as in _truncate_seq_pair,
+        without modifying the sequences or appending [SEP]."""
+        if len_b == 0:
+            max_length += 1
+
+        while len_a + len_b > max_length:
+            if len_a > len_b:
+                len_a -= 1
+            else:
+                len_b -= 1
+
+        return len_a, len_b
+
     def preprocess_classification_tokens(self, tokens, max_len=BERT_MAX_LEN):
         """Preprocessing of input tokens:
             - add BERT sentence markers ([CLS] and [SEP])
@@ -114,47 +163,49 @@ class Tokenizer:
                             (documents will be truncated or padded).
                             Defaults to 512.
         Returns:
-            tuple: A tuple containing the following three lists
-                list of preprocesssed token lists
-                list of input mask lists
-                list of token type id lists
+            tuple: A tuple containing the following three items
+                array of preprocesssed token ids of shape (n, max_len)
+                array of input masks of shape (n, max_len)
+                array of token type ids of shape (n, max_len), or None
+                    for single sequences
         """
         if max_len > BERT_MAX_LEN:
             print("setting max_len to max allowed tokens: {}".format(BERT_MAX_LEN))
             max_len = BERT_MAX_LEN
 
+        input_ids = np.full((len(tokens), max_len), self._pad_id, dtype=np.int64)
+        input_mask = np.zeros((len(tokens), max_len), dtype=np.int64)
+
         if isinstance(tokens[0][0], str):
-            tokens = [x[0 : max_len - 2] + ["[SEP]"] for x in tokens]
             token_type_ids = None
+            for i, x in enumerate(tokens):
+                # [CLS] x [SEP]
+                len_x = min(len(x), max_len - 2)
+                input_ids[i, 0] = self._cls_id
+                input_ids[i, 1 : len_x + 1] = self.tokenizer.convert_tokens_to_ids(x[:len_x])
+                input_ids[i, len_x + 1] = self._sep_id
+                input_mask[i, : len_x + 2] = 1
         else:
-            # get tokens for each sentence [[t00, t01, ...] [t10, t11,... ]]
-            tokens = [
-                self._truncate_seq_pair(sentence[0], sentence[1], max_len - 3)
-                for sentence in tokens
-            ]
-
-            # construct token_type_ids
-            # [[0, 0, 0, 0, ... 0, 1, 1, 1, ... 1], [0, 0, 0, ..., 1, 1, ]
-            token_type_ids = [
-                [[i] * len(sentence) for i, sentence in enumerate(example)] for example in tokens
-            ]
-            # merge sentences
-            tokens = [[token for sentence in example for token in sentence] for example in tokens]
-            # prefix with [0] for [CLS]
-            token_type_ids = [
-                [0] + [i for sentence in example for i in sentence] for example in token_type_ids
-            ]
-            # pad sequence
-            token_type_ids = [x + [0] * (max_len - len(x)) for x in token_type_ids]
-
-        tokens = [["[CLS]"] + x for x in tokens]
-        # convert tokens to indices
-        tokens = [self.tokenizer.convert_tokens_to_ids(x) for x in tokens]
-        # pad sequence
-        tokens = [x + [0] * (max_len - len(x)) for x in tokens]
-        # create input mask
-        input_mask = [[min(1, x) for x in y] for y in tokens]
-        return tokens, input_mask, token_type_ids
+            # [0, 0, 0, 0, ... 0, 1, 1, 1, ... 1, 0, 0, ...]
+            token_type_ids = np.zeros((len(tokens), max_len), dtype=np.int64)
+            for i, (tokens_a, tokens_b) in enumerate(tokens):
+                # [CLS] a [SEP] b [SEP]
+                len_a, len_b = self._truncate_seq_pair_lengths(
+                    len(tokens_a), len(tokens_b), max_len - 3
+                )
+                ids = self.tokenizer.convert_tokens_to_ids(tokens_a[:len_a] + tokens_b[:len_b])
+                input_ids[i, 0] = self._cls_id
+                input_ids[i, 1 : len_a + 1] = ids[:len_a]
+                input_ids[i, len_a + 1] = self._sep_id
+                end = len_a + 2
+                if len_b > 0:
+                    input_ids[i, end : end + len_b] = ids[len_a:]
+                    input_ids[i, end + len_b] = self._sep_id
+                    token_type_ids[i, end : end + len_b + 1] = 1
+                    end += len_b + 1
+                input_mask[i, :end] = 1
+
+        return input_ids, input_mask, token_type_ids
 
     def preprocess_encoder_tokens(self, tokens, max_len=BERT_MAX_LEN):
         """Preprocessing of input tokens:
@@ -170,10 +221,10 @@ class Tokenizer:
                             (documents will be truncated or padded).
                             Defaults to 512.
         Returns:
-            tuple: A tuple containing the following four lists
+            tuple: A tuple containing the following four items
                 list of preprocesssed token lists
-                list of input id lists
-                list of input mask lists
+                array of input ids of shape (n, max_len)
+                array of input masks of shape (n, max_len)
                 list of token type id lists
         """
         if max_len > BERT_MAX_LEN:
@@ -205,12 +256,12 @@ class Tokenizer:
             token_type_ids = [x + [0] * (max_len - len(x)) for x in token_type_ids]
 
         tokens = [["[CLS]"] + x for x in tokens]
-        # convert tokens to indices
-        input_ids = [self.tokenizer.convert_tokens_to_ids(x) for x in tokens]
-        # pad sequence
-        input_ids = [x + [0] * (max_len - len(x)) for x in input_ids]
+        # convert tokens to indices and pad sequence
+        input_ids = np.full((len(tokens), max_len), self._pad_id, dtype=np.int64)
+        for i, x in enumerate(tokens):
+            input_ids[i, : len(x)] = self.tokenizer.convert_tokens_to_ids(x)
         # create input mask
-        input_mask = [[min(1, x) for x in y] for y in input_ids]
+        input_mask = (input_ids != self._pad_id).astype(np.int64)
         return tokens, input_ids, input_mask, token_type_ids
 
     def tokenize_ner(
@@ -247,23 +298,24 @@ class Tokenizer:
                 is labeled as trailing_piece_tag. Default value is "X".
 
         Returns:
-            tuple: A tuple containing the following four lists.
-                1. input_ids_all: List of lists. Each sublist contains
-                    numerical values, i.e. token ids, corresponding to the
-                    tokens in the input text data.
-                2. input_mask_all: List of lists. Each sublist
-                    contains the attention mask of the input token id list,
-                    1 for input tokens and 0 for padded tokens, so that
-                    padded tokens are not attended to.
-                3. trailing_token_mask: List of lists. Each sublist is
-                    a boolean list, True for the first word piece of each
+            tuple: A tuple containing the following four arrays of shape
+                (number of sentences, max_len).
+                1. input_ids_all: Each row contains numerical values, i.e.
+                    token ids, corresponding to the tokens in the input
+                    text data.
+                2. input_mask_all: Each row contains the attention mask of
+                    the input token id list, 1 for input tokens and 0 for
+                    padded tokens, so that padded tokens are not attended to.
+                3. trailing_token_mask: Each row is a boolean
+                    array, True for the first word piece of each
                     original word, False for the trailing word pieces,
                     e.g. "##ize". This mask is useful for removing the
                     predictions on trailing word pieces, so that each
                     original word in the input text has a unique predicted
                     label.
-                4. label_ids_all: List of lists of numerical labels,
-                    each sublist contains token labels of a input
+                4. label_ids_all: Array of numerical labels, or of the
+                    original labels if label_map is not provided. Each row
+                    contains token labels of a input
                     sentence/paragraph, if labels is provided. If the `labels`
                     argument is not provided, the value of this is None.
         """
@@ -296,11 +348,34 @@ class Tokenizer:
             # create an artificial label list for creating trailing token mask
             labels = [["O"] * len(t) for t in text]
 
-        input_ids_all = []
-        input_mask_all = []
-        label_ids_all = []
-        trailing_token_mask_all = []
-        for t, t_labels in zip(text, labels):
+        # look up the labels of padded tokens and trailing word pieces once
+        o_label, trailing_label = "O", trailing_piece_tag
+        if label_available and label_map:
+            o_label, trailing_label = label_map.get("O"), label_map.get(trailing_piece_tag)
+
+        # tokenize the words of all sentences in a single parallel batch
+        word_encodings_all = self.fast_tokenizer.encode_batch([word for t in text for word in t])
+        word_start = 0
+
+        if label_available:
+            # map the labels of all words at once, through a lookup table
+            # built from the few unique labels
+            unique_labels, label_index = np.unique(
+                [tag for t_labels in labels for tag in t_labels], return_inverse=True
+            )
+            if label_map:
+                unique_labels = np.array([label_map[tag] for tag in unique_labels])
+            word_labels_all = unique_labels[label_index]
+
+        # padded tokens are masked out, but kept in the trailing token mask
+        input_ids_all = np.full((len(text), max_len), self._pad_id, dtype=np.int64)
+        input_mask_all = np.zeros((len(text), max_len), dtype=np.int64)
+        trailing_token_mask_all = np.ones((len(text), max_len), dtype=np.bool_)
+        if label_available:
+            label_ids_all = np.full(
+                (len(text), max_len), o_label, dtype=np.int64 if label_map else object
+            )
+        for i, (t, t_labels) in enumerate(zip(text, labels)):
 
             if len(t) != len(t_labels):
                 raise ValueError(
@@ -309,56 +384,37 @@ class Tokenizer:
                     )
                 )
 
-            new_labels = []
-            new_tokens = []
-            if label_available:
-                for word, tag in zip(t, t_labels):
-                    sub_words = self.tokenizer.tokenize(word)
-                    for count, sub_word in enumerate(sub_words):
-                        if count > 0:
-                            tag = trailing_piece_tag
-                        new_labels.append(tag)
-                        new_tokens.append(sub_word)
-            else:
-                for word in t:
-                    sub_words = self.tokenizer.tokenize(word)
-                    for count, sub_word in enumerate(sub_words):
-                        if count > 0:
-                            tag = trailing_piece_tag
-                        else:
-                            tag = "O"
-                        new_labels.append(tag)
-                        new_tokens.append(sub_word)
-
-            if len(new_tokens) > max_len:
-                new_tokens = new_tokens[:max_len]
-                new_labels = new_labels[:max_len]
-            input_ids = self.tokenizer.convert_tokens_to_ids(new_tokens)
-
-            # The mask has 1 for real tokens and 0 for padding tokens.
-            # Only real tokens are attended to.
-            input_mask = [1.0] * len(input_ids)
-
-            # Zero-pad up to the max sequence length.
-            padding = [0.0] * (max_len - len(input_ids))
-            label_padding = ["O"] * (max_len - len(input_ids))
+            # align word pieces with the index of the word they belong to
+            input_ids = []
+            word_ids = []
+            words = slice(word_start, word_start + len(t))
+            word_start += len(t)
+            word_encodings = word_encodings_all[words]
+            for word_id, word_encoding in enumerate(word_encodings):
+                input_ids += word_encoding.ids
+                word_ids += [word_id] * len(word_encoding.ids)
 
-            input_ids += padding
-            input_mask += padding
-            new_labels += label_padding
+            if len(input_ids) > max_len:
+                input_ids = input_ids[:max_len]
+                word_ids = word_ids[:max_len]
 
-            trailing_token_mask_all.append(
-                [True if label != trailing_piece_tag else False for label in new_labels]
-            )
+            # the first word piece of each word is the one that differs from
+            # the word of its preceding piece
+            trailing_token_mask = [w != prev for prev, w in zip([-1] + word_ids, word_ids)]
 
-            if label_map:
-                label_ids = [label_map[label] for label in new_labels]
-            else:
-                label_ids = new_labels
+            if label_available:
+                new_labels = np.where(
+                    trailing_token_mask, word_labels_all[words][word_ids], trailing_label
+                )
 
-            input_ids_all.append(input_ids)
-            input_mask_all.append(input_mask)
-            label_ids_all.append(label_ids)
+            # The mask has 1 for real tokens and 0 for padding tokens.
+            # Only real tokens are attended to.
+            num_tokens = len(input_ids)
+            input_ids_all[i, :num_tokens] = input_ids
+            input_mask_all[i, :num_tokens] = 1
+            trailing_token_mask_all[i, :num_tokens] = trailing_token_mask
+            if label_available:
+                label_ids_all[i, :num_tokens] = new_labels
 
         if label_available:
             return (input_ids_all, input_mask_all, trailing_token_mask_all, label_ids_all)
@@ -366,51 +422,116 @@ class Tokenizer:
             return input_ids_all, input_mask_all, trailing_token_mask_all, None
 
 
+def _is_distributed():
+    return torch.distributed.is_available() and torch.distributed.is_initialized()
+
+
+def _workers_use_fork():
+    # without an explicit start method the platform default is listed first
+    start_method = (
+        multiprocessing.get_start_method(allow_none=True)
+        or multiprocessing.get_all_start_methods()[0]
+    )
+    return start_method == "fork"
+
+
 def create_data_loader(
-    input_ids, input_mask, label_ids=None, sample_method="random", batch_size=32
+    input_ids,
+    input_mask,
+    label_ids=None,
+    sample_method="random",
+    batch_size=32,
+    num_workers=2,
+    pin_memory=True,
 ):
     """
     Create a dataloader for sampling and serving data batches.
 
     Args:
-        input_ids (list): List of lists. Each sublist contains numerical
-            values, i.e. token ids, corresponding to the tokens in the input
-            text data.
-        input_mask (list): List of lists. Each sublist contains the attention
-            mask of the input token id list, 1 for input tokens and 0 for
-            padded tokens, so that padded tokens are not attended to.
-        label_ids (list, optional): List of lists of numerical labels,
-            each sublist contains token labels of a input
+        input_ids (list or np.ndarray): List of lists or array of shape
+            (n, max_len). Each row contains numerical values, i.e. token ids,
+            corresponding to the tokens in the input text data.
+        input_mask (list or np.ndarray): List of lists or array of shape
+            (n, max_len). Each row contains the attention mask of the input
+            token id list, 1 for input tokens and 0 for padded tokens, so
+            that padded tokens are not attended to.
+        label_ids (list or np.ndarray, optional): List of lists or array of
+            numerical labels, each row contains token labels of a input
             sentence/paragraph. Default value is None.
         sample_method (str, optional): Order of data sampling. Accepted
-            values are "random", "sequential". Default value is "random".
+            values are "random", "sequential", "distributed". "random" is
+            replaced by "distributed" when torch.distributed is initialized,
+            in which case the caller should call `set_epoch` on
+            `dataloader.sampler.sampler` at the start of every epoch.
+            Default value is "random".
         batch_size (int, optional): Number of samples used in each training
             iteration. Default value is 32.
+        num_workers (int, optional): Number of worker processes assembling
+            batches. If 0, batches are assembled in the main process.
+            Workers started with a method other than fork access the tensors
+            through shared memory instead of copying them. Default value is 2.
+        pin_memory (bool, optional): Whether to copy batches into pinned
+            memory for faster transfers to GPUs. Ignored when CUDA is not
+            available. Default value is True.
 
     Returns:
         DataLoader: A Pytorch Dataloader containing the input_ids tensor,
             input_mask tensor, and label_ids (if provided) tensor.
+            input_mask is a bool tensor, and label_ids is an int16 tensor
+            if all labels fit into int16, to reduce host to GPU transfers.
+            Labels need to be cast to long before computing the loss.
 
     """
-    input_ids_tensor = torch.tensor(input_ids, dtype=torch.long)
-    input_mask_tensor = torch.tensor(input_mask, dtype=torch.long)
-
-    if label_ids:
-        label_ids_tensor = torch.tensor(label_ids, dtype=torch.long)
-        tensor_data = TensorDataset(input_ids_tensor, input_mask_tensor, label_ids_tensor)
+    # arrays that are already int64 are wrapped without copying
+    input_ids_tensor = torch.from_numpy(np.asarray(input_ids, dtype=np.int64))
+    input_mask_tensor = torch.from_numpy(np.asarray(input_mask, dtype=np.bool_))
+
+    if label_ids is not None:
+        label_ids = np.asarray(label_ids, dtype=np.int64)
+        int16 = np.iinfo(np.int16)
+        if label_ids.size and int16.min <= label_ids.min() and label_ids.max() <= int16.max:
+            label_ids = label_ids.astype(np.int16)
+        label_ids_tensor = torch.from_numpy(label_ids)
+        tensors = [input_ids_tensor, input_mask_tensor, label_ids_tensor]
     else:
-        tensor_data = TensorDataset(input_ids_tensor, input_mask_tensor)
+        tensors = [input_ids_tensor, input_mask_tensor]
+
+    if num_workers > 0 and not _workers_use_fork():
+        # spawned workers receive the dataset by pickling, move the data to
+        # shared memory so that they read it in place instead of each getting
+        # its own copy; forked workers already share the parent's memory
+        tensors = [t.share_memory_() for t in tensors]
+    tensor_data = TensorDataset(*tensors)
+
+    if sample_method == "random" and _is_distributed():
+        sample_method = "distributed"
 
     if sample_method == "random":
         sampler = RandomSampler(tensor_data)
     elif sample_method == "sequential":
         sampler = SequentialSampler(tensor_data)
+    elif sample_method == "distributed":
+        sampler = DistributedSampler(tensor_data)
     else:
         raise ValueError(
-            "Invalid sample_method value, accepted values are: " "random and sequential."
+            "Invalid sample_method value, accepted values are: "
+            "random, sequential and distributed."
         )
 
-    dataloader = DataLoader(tensor_data, sampler=sampler, batch_size=batch_size)
+    # sample whole batches of indices, so that each batch is fetched from the
+    # TensorDataset with a single indexing operation instead of per sample;
+    # with the distributed sampler all ranks need the same number of batches
+    batch_sampler = BatchSampler(
+        sampler, batch_size=batch_size, drop_last=sample_method == "distributed"
+    )
+    # batch_size=None disables automatic batching, supported since PyTorch 1.2
+    dataloader = DataLoader(
+        tensor_data,
+        sampler=batch_sampler,
+        batch_size=None,
+        num_workers=num_workers,
+        pin_memory=pin_memory and torch.cuda.is_available(),
+    )
 
     return dataloader
 
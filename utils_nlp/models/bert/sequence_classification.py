@@ -102,7 +102,7 @@ class BERTSequenceClassifier:
         input_mask_tensor = torch.tensor(input_mask, dtype=torch.long)
         labels_tensor = torch.tensor(labels, dtype=torch.long)
 
-        if token_type_ids:
+        if token_type_ids is not None:
             token_type_ids_tensor = torch.tensor(token_type_ids, dtype=torch.long)
             train_dataset = TensorDataset(
                 token_ids_tensor,
@@ -159,7 +159,7 @@ class BERTSequenceClassifier:
         for epoch in range(num_epochs):
             training_loss = 0
             for i, batch in enumerate(tqdm(train_dataloader, desc="Iteration")):
-                if token_type_ids:
+                if token_type_ids is not None:
                     x_batch, mask_batch, token_type_ids_batch, y_batch = tuple(
                         t.to(device) for t in batch
                     )
@@ -236,7 +236,7 @@ class BERTSequenceClassifier:
         token_ids_tensor = torch.tensor(token_ids, dtype=torch.long)
         input_mask_tensor = torch.tensor(input_mask, dtype=torch.long)
 
-        if token_type_ids:
+        if token_type_ids is not None:
             token_type_ids_tensor = torch.tensor(token_type_ids, dtype=torch.long)
             test_dataset = TensorDataset(
                 token_ids_tensor, input_mask_tensor, token_type_ids_tensor
@@ -251,7 +251,7 @@ class BERTSequenceClassifier:
 
         preds = []
         for i, batch in enumerate(tqdm(test_dataloader, desc="Iteration")):
-            if token_type_ids:
+            if token_type_ids is not None:
                 x_batch, mask_batch, token_type_ids_batch = tuple(
                     t.to(device) for t in batch
                 )
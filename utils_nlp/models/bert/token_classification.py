@@ -13,6 +13,7 @@ import torch
 import torch.nn as nn
 from pytorch_pretrained_bert.modeling import BertForTokenClassification
 from pytorch_pretrained_bert.optimization import BertAdam
+from torch.utils.data.distributed import DistributedSampler
 from tqdm import tqdm, trange
 
 from utils_nlp.models.bert.common import Language, create_data_loader
@@ -159,7 +160,12 @@ class BERTTokenClassifier:
         )
 
         self.model.train()
-        for _ in trange(int(num_epochs), desc="Epoch"):
+        for epoch in trange(int(num_epochs), desc="Epoch"):
+            # reshuffle the shards differently on every epoch when the
+            # "random" sampling was switched to distributed sampling
+            sampler = train_dataloader.sampler.sampler
+            if isinstance(sampler, DistributedSampler):
+                sampler.set_epoch(epoch)
             tr_loss = 0
             nb_tr_steps = 0
             for step, batch in enumerate(tqdm(train_dataloader, desc="Iteration", mininterval=30)):
@@ -167,7 +173,7 @@ class BERTTokenClassifier:
                 b_token_ids, b_input_mask, b_label_ids = batch
 
                 loss = self.model(
-                    input_ids=b_token_ids, attention_mask=b_input_mask, labels=b_label_ids
+                    input_ids=b_token_ids, attention_mask=b_input_mask, labels=b_label_ids.long()
                 )
 
                 if num_gpus_used > 1:
@@ -236,7 +242,7 @@ class BERTTokenClassifier:
         for step, batch in enumerate(tqdm(test_dataloader, desc="Iteration", mininterval=10)):
             batch = tuple(t.to(device) for t in batch)
             true_label_available = False
-            if labels:
+            if labels is not None:
                 b_input_ids, b_input_mask, b_labels = batch
                 true_label_available = True
             else:
@@ -247,7 +253,7 @@ class BERTTokenClassifier:
                 if true_label_available:
                     active_loss = b_input_mask.view(-1) == 1
                     active_logits = logits.view(-1, self.num_labels)[active_loss]
-                    active_labels = b_labels.view(-1)[active_loss]
+                    active_labels = b_labels.view(-1)[active_loss].long()
                     loss_fct = nn.CrossEntropyLoss()
                     tmp_eval_loss = loss_fct(active_logits, active_labels)
 
@@ -330,7 +336,7 @@ def postprocess_token_labels(
         for label_list, mask_list in zip(labels_org, input_mask)
     ]
 
-    if remove_trailing_word_pieces and trailing_token_mask:
+    if remove_trailing_word_pieces and trailing_token_mask is not None:
         # Remove the padded values in trailing_token_mask first
         token_mask_no_padding = [
             [token for token, padding in zip(t_mask, p_mask) if padding == 1]
@@ -244,10 +244,10 @@ class TokenClassificationProcessor:
 
             # The mask has 1 for real tokens and 0 for padding tokens.
             # Only real tokens are attended to.
-            input_mask = [1.0] * len(input_ids)
+            input_mask = [1] * len(input_ids)
 
             # Zero-pad up to the max sequence length.
-            padding = [0.0] * (max_len - len(input_ids))
+            padding = [0] * (max_len - len(input_ids))
             label_padding = ["O"] * (max_len - len(input_ids))
 
             input_ids += padding